@@ -7,6 +7,8 @@ class Exchange:
     """A helper class representing the lines to send to PandA and
     the lines received"""
 
+    __slots__ = ("to_send", "received", "is_multiline")
+
     def __init__(self, to_send: Union[str, List[str]]):
         if isinstance(to_send, str):
             self.to_send = [to_send]
@@ -103,7 +103,8 @@ class AsyncioClient:
             received = await reader.read(4096)
             try:
                 to_send = self._ctrl_connection.receive_bytes(received)
-                await self._ctrl_stream.write_and_drain(to_send)
+                if to_send:
+                    await self._ctrl_stream.write_and_drain(to_send)
                 for command, response in self._ctrl_connection.responses():
                     queue = self._ctrl_queues.pop(id(command))
                     queue.put_nowait(response)
@@ -89,15 +89,15 @@ class BlockingClient:
             commands = [commands]
         else:
             commands = list(commands)
-        for command in commands:
-            to_send = self._ctrl_connection.send(command)
-            s.sendall(to_send)
+        # Send all the commands in a single write so they are pipelined
+        s.sendall(b"".join(self._ctrl_connection.send(c) for c in commands))
         # Rely on dicts being ordered, Ellipsis is shorthand for "no response yet"
         cr = {id(command): ... for command in commands}
         while ... in cr.values():
             received = s.recv(4096)
             to_send = self._ctrl_connection.receive_bytes(received)
-            s.sendall(to_send)
+            if to_send:
+                s.sendall(to_send)
             for command, response in self._ctrl_connection.responses():
                 assert cr[id(command)] is ..., "Already got response for {command}"
                 cr[id(command)] = response
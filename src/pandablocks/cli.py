@@ -2,7 +2,7 @@ import asyncio
 import io
 import logging
 import pathlib
-from typing import Awaitable, List
+from typing import Awaitable, List, Optional
 
 import click
 from click.exceptions import ClickException
@@ -117,9 +117,14 @@ try:
         help="Arm PCAP at the start, and after each successful acquisition",
         is_flag=True,
     )
+    @click.option(
+        "--chunk-rows",
+        help="Number of rows in each chunk of a dataset, default from datatype",
+        type=int,
+    )
     @click.argument("host")
     @click.argument("scheme")
-    def hdf(host: str, scheme: str, num: int, arm: bool):
+    def hdf(host: str, scheme: str, num: int, arm: bool, chunk_rows: Optional[int]):
         """
         Write an HDF file for each PCAP acquisition for HOST
 
@@ -127,7 +132,9 @@ try:
         starting from 1
         """
 
-        async def _write_hdf_files(host: str, scheme: str, num: int, arm: bool):
+        async def _write_hdf_files(
+            host: str, scheme: str, num: int, arm: bool, chunk_rows: Optional[int]
+        ):
             def file_name_generator(scheme: str):
                 """Yield incrementally numbered file names based on provided scheme"""
                 counter = 1
@@ -137,12 +144,16 @@ try:
 
             async with AsyncioClient(host) as client:
                 await write_hdf_files(
-                    client, file_names=file_name_generator(scheme), num=num, arm=arm
+                    client,
+                    file_names=file_name_generator(scheme),
+                    num=num,
+                    arm=arm,
+                    chunk_rows=chunk_rows,
                 )
 
         # Don't use asyncio.run to workaround Python3.7 bug
         # https://bugs.python.org/issue38013
-        asyncio_run(_write_hdf_files(host, scheme, num, arm))
+        asyncio_run(_write_hdf_files(host, scheme, num, arm, chunk_rows))
 
 except ImportError:
 
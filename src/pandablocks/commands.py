@@ -1,16 +1,18 @@
 import logging
-import re
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import (
     Any,
     Callable,
+    ClassVar,
     Dict,
-    Generator,
     Generic,
     List,
+    NamedTuple,
     Optional,
     Tuple,
+    Type,
     TypeVar,
     Union,
     overload,
@@ -64,19 +66,24 @@ T3 = TypeVar("T3")
 T4 = TypeVar("T4")
 
 
-# Checks whether the server will interpret cmd as a table command: search for
-# first of '?', '=', '<', if '<' found first then it's a multiline command.
-MULTILINE_COMMAND = re.compile(r"^[^?=]*<")
-
-
 def is_multiline_command(cmd: str):
-    return MULTILINE_COMMAND.match(cmd) is not None
+    # Checks whether the server will interpret cmd as a table command: search for
+    # first of '?', '=', '<', if '<' found first then it's a multiline command.
+    # Most commands have no '<' at all, so check for that first using C level
+    # string searches rather than a regex
+    index = cmd.find("<")
+    if index < 0:
+        return False
+    head = cmd[:index]
+    return "?" not in head and "=" not in head
 
 
 @dataclass
 class Command(Generic[T]):
     """Abstract baseclass for all ControlConnection commands to be inherited from"""
 
+    __slots__ = ()
+
     def execute(self) -> ExchangeGenerator[T]:
         # A generator that sends lines to the PandA, gets lines back, and returns a
         # response
@@ -87,6 +94,42 @@ class CommandException(Exception):
     """Raised if a `Command` receives a mal-formed response"""
 
 
+# These checks raise rather than assert so they still happen when running with
+# python -O. The exception has no message as the connection adds the command and
+# the lines received to it when reporting the error.
+def _check_ok(line: str):
+    if line != "OK":
+        raise CommandException()
+
+
+def _ok_value(line: str) -> str:
+    if not line.startswith("OK ="):
+        raise CommandException()
+    return line[4:]
+
+
+@dataclass
+class _SingleExchangeCommand(Command[T]):
+    """Base class for Commands that send a single `Exchange` and make their response
+    from the lines received. This lets `_execute_commands` batch them up without
+    running a generator for each one."""
+
+    __slots__ = ()
+
+    def _exchange(self) -> Exchange:
+        # The Exchange with the lines to send to the PandA
+        raise NotImplementedError(self)
+
+    def _response(self, ex: Exchange) -> T:
+        # Make the response from the lines the PandA sent back
+        raise NotImplementedError(self)
+
+    def execute(self) -> ExchangeGenerator[T]:
+        ex = self._exchange()
+        yield ex
+        return self._response(ex)
+
+
 # `execute_commands()` actually returns a list with length equal to the number
 # of tasks passed; however, Tuple is used similar to the annotation for
 # zip() because typing does not support variadic type variables.  See
@@ -129,6 +172,16 @@ def _execute_commands(*commands):
     # If we add type annotations to this function then mypy complains:
     # Overloaded function implementation does not accept all possible arguments
     # As we want to type check this, we put the logic in _zip_with_return
+    if all(
+        type(command).execute is _SingleExchangeCommand.execute for command in commands
+    ):
+        # Common case of a batch of Gets, Puts, etc. Each one needs exactly one
+        # Exchange, so yield them all at once without running their generators.
+        # Subclasses that override execute() still have it called below
+        exchanges = [command._exchange() for command in commands]
+        if exchanges:
+            yield exchanges
+        return tuple(command._response(ex) for command, ex in zip(commands, exchanges))
     ret = yield from _zip_with_return([command.execute() for command in commands])
     return ret
 
@@ -136,38 +189,39 @@ def _execute_commands(*commands):
 def _zip_with_return(
     generators: List[ExchangeGenerator[Any]],
 ) -> ExchangeGenerator[Tuple[Any, ...]]:
-    # Sentinel to show what generators are not yet exhausted
-    pending = object()
-    returns = [pending] * len(generators)
-    while True:
+    returns: List[Any] = [None] * len(generators)
+    # The generators that are not yet exhausted, with their index in generators.
+    # Exhausted generators are dropped so later rounds only visit live ones
+    active = deque(enumerate(generators))
+    while active:
         yields: List[Exchange] = []
-        for i, gen in enumerate(generators):
-            # If we haven't exhausted the generator
-            if returns[i] is pending:
-                try:
-                    # Get the exchanges that it wants to fill in
-                    exchanges = next(gen)
-                except StopIteration as e:
-                    # Generator is exhausted, store its return value
-                    returns[i] = e.value
+        for _ in range(len(active)):
+            i, gen = active.popleft()
+            try:
+                # Get the exchanges that it wants to fill in
+                exchanges = next(gen)
+            except StopIteration as e:
+                # Generator is exhausted, store its return value
+                returns[i] = e.value
+            else:
+                # Add the exchanges to the list, and keep the generator for the
+                # next round
+                if isinstance(exchanges, list):
+                    yields += exchanges
                 else:
-                    # Add the exchanges to the list
-                    if isinstance(exchanges, list):
-                        yields += exchanges
-                    else:
-                        yields.append(exchanges)
+                    yields.append(exchanges)
+                active.append((i, gen))
         if yields:
             # There were some Exchanges yielded, so yield them all up
             # for the Connection to fill in
             yield yields
-        else:
-            # All the generators are exhausted, so return the tuple of all
-            # their return values
-            return tuple(returns)
+    # All the generators are exhausted, so return the tuple of all
+    # their return values
+    return tuple(returns)
 
 
 @dataclass
-class Raw(Command[List[str]]):
+class Raw(_SingleExchangeCommand[List[str]]):
     """Send a raw command
 
     Args:
@@ -180,16 +234,19 @@ class Raw(Command[List[str]]):
         Raw(["SEQ1.TABLE?"]) -> ["!1", "!1", "!0", "!0", "."])
     """
 
+    __slots__ = ("inp",)
+
     inp: List[str]
 
-    def execute(self) -> ExchangeGenerator[List[str]]:
-        ex = Exchange(self.inp)
-        yield ex
+    def _exchange(self) -> Exchange:
+        return Exchange(self.inp)
+
+    def _response(self, ex: Exchange) -> List[str]:
         return ex.received
 
 
 @dataclass
-class Get(Command[Union[str, List[str]]]):
+class Get(_SingleExchangeCommand[Union[str, List[str]]]):
     """Get the value of a field or star command.
 
     If the form of the expected return is known, consider using `GetLine`
@@ -205,22 +262,23 @@ class Get(Command[Union[str, List[str]]]):
         Get("*IDN") -> "PandA 1.1..."
     """
 
+    __slots__ = ("field",)
+
     field: str
 
-    def execute(self) -> ExchangeGenerator[Union[str, List[str]]]:
-        ex = Exchange(f"{self.field}?")
-        yield ex
+    def _exchange(self) -> Exchange:
+        return Exchange(f"{self.field}?")
+
+    def _response(self, ex: Exchange) -> Union[str, List[str]]:
         if ex.is_multiline:
             return ex.multiline
         else:
             # We got OK =value
-            line = ex.line
-            assert line.startswith("OK =")
-            return line[4:]
+            return _ok_value(ex.line)
 
 
 @dataclass
-class GetLine(Command[str]):
+class GetLine(_SingleExchangeCommand[str]):
     """Get the value of a field or star command, when the result is expected to be a
     single line.
 
@@ -233,19 +291,20 @@ class GetLine(Command[str]):
         GetLine("*IDN") -> "PandA 1.1..."
     """
 
+    __slots__ = ("field",)
+
     field: str
 
-    def execute(self) -> ExchangeGenerator[str]:
-        ex = Exchange(f"{self.field}?")
-        yield ex
+    def _exchange(self) -> Exchange:
+        return Exchange(f"{self.field}?")
+
+    def _response(self, ex: Exchange) -> str:
         # Expect "OK =value"
-        line = ex.line
-        assert line.startswith("OK =")
-        return line[4:]
+        return _ok_value(ex.line)
 
 
 @dataclass
-class GetMultiline(Command[List[str]]):
+class GetMultiline(_SingleExchangeCommand[List[str]]):
     """Get the value of a field or star command, when the result is expected to be a
     multiline response.
 
@@ -258,16 +317,19 @@ class GetMultiline(Command[List[str]]):
         GetMultiline("*METADATA.*") -> ["LABEL_FILTER1", "APPNAME", ...]
     """
 
+    __slots__ = ("field",)
+
     field: str
 
-    def execute(self) -> ExchangeGenerator[List[str]]:
-        ex = Exchange(f"{self.field}?")
-        yield ex
+    def _exchange(self) -> Exchange:
+        return Exchange(f"{self.field}?")
+
+    def _response(self, ex: Exchange) -> List[str]:
         return ex.multiline
 
 
 @dataclass
-class Put(Command[None]):
+class Put(_SingleExchangeCommand[None]):
     """Put the value of a field.
 
     Args:
@@ -284,18 +346,19 @@ class Put(Command[None]):
     field: str
     value: Union[str, List[str]] = ""
 
-    def execute(self) -> ExchangeGenerator[None]:
+    def _exchange(self) -> Exchange:
         if isinstance(self.value, list):
             # Multiline table with blank line to terminate
-            ex = Exchange([f"{self.field}<"] + self.value + [""])
+            return Exchange([f"{self.field}<"] + self.value + [""])
         else:
-            ex = Exchange(f"{self.field}={self.value}")
-        yield ex
-        assert ex.line == "OK"
+            return Exchange(f"{self.field}={self.value}")
+
+    def _response(self, ex: Exchange) -> None:
+        _check_ok(ex.line)
 
 
 @dataclass
-class Append(Command[None]):
+class Append(_SingleExchangeCommand[None]):
     """Append the value of a table field.
 
     Args:
@@ -307,32 +370,41 @@ class Append(Command[None]):
         Append("SEQ1.TABLE", ["1048576", "0", "1000", "1000"])
     """
 
+    __slots__ = ("field", "value")
+
     field: str
     value: List[str]
 
-    def execute(self) -> ExchangeGenerator[None]:
+    def _exchange(self) -> Exchange:
         # Multiline table with blank line to terminate
-        ex = Exchange([f"{self.field}<<"] + self.value + [""])
-        yield ex
-        assert ex.line == "OK"
+        return Exchange([f"{self.field}<<"] + self.value + [""])
+
+    def _response(self, ex: Exchange) -> None:
+        _check_ok(ex.line)
 
 
-class Arm(Command[None]):
+class Arm(_SingleExchangeCommand[None]):
     """Arm PCAP for an acquisition by sending ``*PCAP.ARM=``"""
 
-    def execute(self) -> ExchangeGenerator[None]:
-        ex = Exchange("*PCAP.ARM=")
-        yield ex
-        assert ex.line == "OK"
+    __slots__ = ()
+
+    def _exchange(self) -> Exchange:
+        return Exchange("*PCAP.ARM=")
 
+    def _response(self, ex: Exchange) -> None:
+        _check_ok(ex.line)
 
-class Disarm(Command[None]):
+
+class Disarm(_SingleExchangeCommand[None]):
     """Disarm PCAP, stopping acquisition by sending ``*PCAP.DISARM=``"""
 
-    def execute(self) -> ExchangeGenerator[None]:
-        ex = Exchange("*PCAP.DISARM=")
-        yield ex
-        assert ex.line == "OK"
+    __slots__ = ()
+
+    def _exchange(self) -> Exchange:
+        return Exchange("*PCAP.DISARM=")
+
+    def _response(self, ex: Exchange) -> None:
+        _check_ok(ex.line)
 
 
 @dataclass
@@ -343,6 +415,11 @@ class GetBlockInfo(Command[Dict[str, BlockInfo]]):
     Args:
         skip_description: If `True`, prevents retrieving the description
             for each Block. This will reduce network calls.
+        description_cache: If given, a dictionary of block name to description
+            that is filled in with each description retrieved, and consulted
+            before retrieving any. Block descriptions do not change while a PandA
+            is running, so passing the same dictionary to repeated calls to the
+            same PandA means the descriptions are only retrieved once.
 
     For example::
 
@@ -355,22 +432,31 @@ class GetBlockInfo(Command[Dict[str, BlockInfo]]):
     """
 
     skip_description: bool = False
+    description_cache: Optional[Dict[str, str]] = field(
+        default=None, repr=False, compare=False
+    )
 
     def execute(self) -> ExchangeGenerator[Dict[str, BlockInfo]]:
         ex = Exchange("*BLOCKS?")
         yield ex
 
-        blocks_list, commands = [], []
+        blocks_list = []
         for line in ex.multiline:
             block, num = line.split()
             blocks_list.append((block, int(num)))
-            commands.append(GetLine(f"*DESC.{block}"))
 
+        description_values: Tuple[Optional[str], ...]
         if self.skip_description:
-            # Must use tuple() to match type returned by _execute_commands
-            description_values = tuple(None for _ in commands)
+            # Must be a tuple to match type returned by _execute_commands
+            description_values = (None,) * len(blocks_list)
         else:
-            description_values = yield from _execute_commands(*commands)
+            cache = {} if self.description_cache is None else self.description_cache
+            missing = [block for block, _ in blocks_list if block not in cache]
+            descriptions = yield from _execute_commands(
+                *[GetLine(f"*DESC.{block}") for block in missing]
+            )
+            cache.update(zip(missing, descriptions))
+            description_values = tuple(cache[block] for block, _ in blocks_list)
 
         block_infos = {
             block: BlockInfo(number=num, description=desc)
@@ -380,12 +466,57 @@ class GetBlockInfo(Command[Dict[str, BlockInfo]]):
         return block_infos
 
 
-# The type of the generators used for creating the Get commands for each field
-# and setting the returned data into the FieldInfo structure
-_FieldGeneratorType = Generator[
-    Union[Exchange, List[Exchange]],
-    None,
-    Tuple[str, FieldInfo],
+# Templates for the start of the fields requested for attributes. These are
+# formatted with the block name once per GetFieldInfo, so the request for each
+# field attribute is then a quick concatenation of prefix, field name and suffix
+_BLOCK_PREFIX = "{block}."
+_BLOCK1_PREFIX = "{block}1."
+_ENUMS_PREFIX = "*ENUMS.{block}."
+
+
+class _FieldAttribute(NamedTuple):
+    """An attribute to request when making the FieldInfo for a field"""
+
+    #: The Command to request it with
+    command: Callable[[str], Command]
+    #: Which of the prefix templates goes before the field name in the request
+    prefix: str
+    #: What goes after the field name in the request
+    suffix: str
+    #: Function to convert the response, if required
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+# The FieldInfo subclass to create for a field, and the attributes to request
+# (in addition to the description) to create it
+_FieldSpec = Tuple[Type[FieldInfo], Tuple[_FieldAttribute, ...]]
+
+# The "param", "read" and "write" field types all share the same subtypes
+_PARAM_SUBTYPES: Dict[Optional[str], _FieldSpec] = {
+    "uint": (UintFieldInfo, (_FieldAttribute(GetLine, _BLOCK1_PREFIX, ".MAX", int),)),
+    "int": (FieldInfo, ()),
+    "scalar": (
+        ScalarFieldInfo,
+        (
+            _FieldAttribute(GetLine, _BLOCK_PREFIX, ".UNITS"),
+            _FieldAttribute(GetLine, _BLOCK_PREFIX, ".SCALE", float),
+            _FieldAttribute(GetLine, _BLOCK_PREFIX, ".OFFSET", int),
+        ),
+    ),
+    "bit": (FieldInfo, ()),
+    "action": (FieldInfo, ()),
+    "lut": (FieldInfo, ()),
+    "enum": (EnumFieldInfo, (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ""),)),
+    "time": (
+        SubtypeTimeFieldInfo,
+        (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".UNITS"),),
+    ),
+}
+
+# The name, type, subtype, FieldInfo subclass, and attributes needed to make the
+# FieldInfo for a field once its attributes have been received
+_FieldMaker = Tuple[
+    str, str, Optional[str], Type[FieldInfo], Tuple[_FieldAttribute, ...]
 ]
 
 
@@ -415,179 +546,95 @@ class GetFieldInfo(Command[Dict[str, FieldInfo]]):
     block: str
     extended_metadata: bool = True
 
-    _commands_map: Dict[
-        Tuple[str, Optional[str]],
-        Callable[
-            [str, str, Optional[str]],
-            _FieldGeneratorType,
-        ],
-    ] = field(init=False, repr=False, default_factory=dict)
-
-    def __post_init__(self):
-        # Map a (type, subtype) to a method that returns the appropriate
-        # subclasss of FieldInfo, and a list of all the Commands to request.
-        # Note that fields that do not have additional attributes are not listed.
-        self._commands_map = {
-            # Order matches that of PandA server's Field Types docs
-            ("time", None): self._time,
-            ("bit_out", None): self._bit_out,
-            ("pos_out", None): self._pos_out,
-            ("ext_out", "timestamp"): self._ext_out,
-            ("ext_out", "samples"): self._ext_out,
-            ("ext_out", "bits"): self._ext_out_bits,
-            ("bit_mux", None): self._bit_mux,
-            ("pos_mux", None): self._pos_mux,
-            ("table", None): self._table,
-            ("param", "uint"): self._uint,
-            ("read", "uint"): self._uint,
-            ("write", "uint"): self._uint,
-            ("param", "int"): self._no_attributes,
-            ("read", "int"): self._no_attributes,
-            ("write", "int"): self._no_attributes,
-            ("param", "scalar"): self._scalar,
-            ("read", "scalar"): self._scalar,
-            ("write", "scalar"): self._scalar,
-            ("param", "bit"): self._no_attributes,
-            ("read", "bit"): self._no_attributes,
-            ("write", "bit"): self._no_attributes,
-            ("param", "action"): self._no_attributes,
-            ("read", "action"): self._no_attributes,
-            ("write", "action"): self._no_attributes,
-            ("param", "lut"): self._no_attributes,
-            ("read", "lut"): self._no_attributes,
-            ("write", "lut"): self._no_attributes,
-            ("param", "enum"): self._enum,
-            ("read", "enum"): self._enum,
-            ("write", "enum"): self._enum,
-            ("param", "time"): self._subtype_time,
-            ("read", "time"): self._subtype_time,
-            ("write", "time"): self._subtype_time,
-        }
-
-    def _get_desc(self, field_name: str) -> GetLine:
-        """Create the Command to retrieve the description"""
-        return GetLine(f"*DESC.{self.block}.{field_name}")
-
-    def _uint(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, maximum = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetLine(f"{self.block}1.{field_name}.MAX"),
-        )
-
-        field_info = UintFieldInfo(field_type, field_subtype, desc, int(maximum))
-        return field_name, field_info
-
-    def _scalar(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, units, scale, offset = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetLine(f"{self.block}.{field_name}.UNITS"),
-            GetLine(f"{self.block}.{field_name}.SCALE"),
-            GetLine(f"{self.block}.{field_name}.OFFSET"),
-        )
-
-        field_info = ScalarFieldInfo(
-            field_type, field_subtype, desc, units, float(scale), int(offset)
-        )
-
-        return field_name, field_info
-
-    def _subtype_time(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, units_labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}.UNITS"),
-        )
-
-        field_info = SubtypeTimeFieldInfo(field_type, field_subtype, desc, units_labels)
-
-        return field_name, field_info
-
-    def _enum(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}"),
-        )
-
-        field_info = EnumFieldInfo(field_type, field_subtype, desc, labels)
-
-        return field_name, field_info
-
-    def _time(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, units, min = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}.UNITS"),
-            GetLine(f"{self.block}1.{field_name}.MIN"),
-        )
-
-        field_info = TimeFieldInfo(field_type, field_subtype, desc, units, float(min))
-
-        return field_name, field_info
-
-    def _bit_out(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, capture_word, offset = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetLine(f"{self.block}1.{field_name}.CAPTURE_WORD"),
-            GetLine(f"{self.block}1.{field_name}.OFFSET"),
-        )
-
-        field_info = BitOutFieldInfo(
-            field_type, field_subtype, desc, capture_word, int(offset)
-        )
-
-        return field_name, field_info
-
-    def _bit_mux(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, max_delay, labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetLine(f"{self.block}1.{field_name}.MAX_DELAY"),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}"),
-        )
-
-        field_info = BitMuxFieldInfo(
-            field_type, field_subtype, desc, int(max_delay), labels
-        )
-
-        return field_name, field_info
-
-    def _pos_mux(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}"),
-        )
-        field_info = PosMuxFieldInfo(field_type, field_subtype, desc, labels)
-
-        return field_name, field_info
-
-    def _table(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        # Ignore the ROW_WORDS attribute as it's new and won't be present on all PandAs,
-        # and there's no easy way to try it and catch an error while also running other
-        # Get commands at the same time
-        table_desc, max_length, fields = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetLine(f"{self.block}1.{field_name}.MAX_LENGTH"),
-            GetMultiline(f"{self.block}1.{field_name}.FIELDS"),
-        )
-
+    #: Map a type, then a subtype, to the subclass of FieldInfo to create, and the
+    #: attributes to request (in addition to the description) to create it.
+    #: Note that fields that do not have
+    #: additional attributes create a FieldInfo with only a description. Nested
+    #: dicts are used as the lookup is faster than making a (type, subtype) key.
+    _COMMAND_MAP: ClassVar[Dict[str, Dict[Optional[str], _FieldSpec]]] = {
+        # Order matches that of PandA server's Field Types docs
+        "time": {
+            None: (
+                TimeFieldInfo,
+                (
+                    _FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".UNITS"),
+                    _FieldAttribute(GetLine, _BLOCK1_PREFIX, ".MIN", float),
+                ),
+            ),
+        },
+        "bit_out": {
+            None: (
+                BitOutFieldInfo,
+                (
+                    _FieldAttribute(GetLine, _BLOCK1_PREFIX, ".CAPTURE_WORD"),
+                    _FieldAttribute(GetLine, _BLOCK1_PREFIX, ".OFFSET", int),
+                ),
+            ),
+        },
+        "pos_out": {
+            None: (
+                PosOutFieldInfo,
+                (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".CAPTURE"),),
+            ),
+        },
+        "ext_out": {
+            "timestamp": (
+                ExtOutFieldInfo,
+                (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".CAPTURE"),),
+            ),
+            "samples": (
+                ExtOutFieldInfo,
+                (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".CAPTURE"),),
+            ),
+            "bits": (
+                ExtOutBitsFieldInfo,
+                (
+                    _FieldAttribute(GetMultiline, _ENUMS_PREFIX, ".CAPTURE"),
+                    _FieldAttribute(GetMultiline, _BLOCK_PREFIX, ".BITS"),
+                ),
+            ),
+        },
+        "bit_mux": {
+            None: (
+                BitMuxFieldInfo,
+                (
+                    _FieldAttribute(GetLine, _BLOCK1_PREFIX, ".MAX_DELAY", int),
+                    _FieldAttribute(GetMultiline, _ENUMS_PREFIX, ""),
+                ),
+            ),
+        },
+        "pos_mux": {
+            None: (
+                PosMuxFieldInfo,
+                (_FieldAttribute(GetMultiline, _ENUMS_PREFIX, ""),),
+            ),
+        },
+        "table": {
+            # Ignore the ROW_WORDS attribute as it's new and won't be present on all
+            # PandAs, and there's no easy way to try it and catch an error while
+            # also running other Get commands at the same time
+            None: (
+                TableFieldInfo,
+                (
+                    _FieldAttribute(GetLine, _BLOCK1_PREFIX, ".MAX_LENGTH", int),
+                    _FieldAttribute(GetMultiline, _BLOCK1_PREFIX, ".FIELDS"),
+                ),
+            ),
+        },
+        "param": _PARAM_SUBTYPES,
+        "read": _PARAM_SUBTYPES,
+        "write": _PARAM_SUBTYPES,
+    }
+
+    def _table_fields(
+        self, field_name: str, fields: List[str]
+    ) -> ExchangeGenerator[Tuple[Dict[str, TableFieldDetails], int]]:
         # Keep track of highest bit index
         max_bit_offset: int = 0
 
+        # Format the block and table field name into these once, not per field
+        enums_prefix = f"*ENUMS.{self.block}1.{field_name}[]."
+        desc_prefix = f"*DESC.{self.block}1.{field_name}[]."
         desc_gets: List[GetLine] = []
         enum_field_gets: List[GetMultiline] = []
         enum_field_names: List[str] = []
@@ -603,14 +650,12 @@ class GetFieldInfo(Command[Dict[str, FieldInfo]]):
                 max_bit_offset = bit_high
 
             if subtype == "enum":
-                enum_field_gets.append(
-                    GetMultiline(f"*ENUMS.{self.block}1.{field_name}[].{name}")
-                )
+                enum_field_gets.append(GetMultiline(enums_prefix + name))
                 enum_field_names.append(name)
 
             fields_dict[name] = TableFieldDetails(subtype, bit_low, bit_high)
 
-            desc_gets.append(GetLine(f"*DESC.{self.block}1.{field_name}[].{name}"))
+            desc_gets.append(GetLine(desc_prefix + name))
 
         # Calculate the number of 32 bit words that comprises one table row
         row_words = max_bit_offset // 32 + 1
@@ -631,75 +676,31 @@ class GetFieldInfo(Command[Dict[str, FieldInfo]]):
         ):
             fields_dict[name].description = desc
 
-        field_info = TableFieldInfo(
-            field_type,
-            field_subtype,
-            table_desc,
-            int(max_length),
-            fields_dict,
-            row_words,
-        )
-
-        return field_name, field_info
-
-    def _pos_out(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, capture_labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}.CAPTURE"),
-        )
-
-        field_info = PosOutFieldInfo(field_type, field_subtype, desc, capture_labels)
-        return field_name, field_info
-
-    def _ext_out(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, capture_labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}.CAPTURE"),
-        )
-
-        field_info = ExtOutFieldInfo(field_type, field_subtype, desc, capture_labels)
-        return field_name, field_info
-
-    def _ext_out_bits(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        desc, bits, capture_labels = yield from _execute_commands(
-            self._get_desc(field_name),
-            GetMultiline(f"{self.block}.{field_name}.BITS"),
-            GetMultiline(f"*ENUMS.{self.block}.{field_name}.CAPTURE"),
-        )
-        field_info = ExtOutBitsFieldInfo(
-            field_type, field_subtype, desc, capture_labels, bits
-        )
-        return field_name, field_info
-
-    def _no_attributes(
-        self, field_name: str, field_type: str, field_subtype: Optional[str]
-    ) -> _FieldGeneratorType:
-        """Calling this method indicates type-subtype pair is known and
-        has no attributes, so only a description needs to be retrieved"""
-        desc = yield from self._get_desc(field_name).execute()
-
-        return field_name, FieldInfo(field_type, field_subtype, desc)
+        return fields_dict, row_words
 
     def execute(self) -> ExchangeGenerator[Dict[str, FieldInfo]]:
         ex = Exchange(f"{self.block}.*?")
         yield ex
-        unsorted: Dict[int, Tuple[str, FieldInfo]] = {}
-        field_generators: List[ExchangeGenerator] = []
+        # The index, name and default FieldInfo of each field
+        ordered: List[Tuple[int, str, FieldInfo]] = []
+        # The Commands to get the description and attributes of every field
+        commands: List[Command] = []
+        # The information needed to make the FieldInfo of every field from the
+        # responses to those commands
+        field_makers: List[_FieldMaker] = []
+        # Look these up once rather than for every field
+        command_map = self._COMMAND_MAP
+        desc_prefix = f"*DESC.{self.block}."
+        prefixes = {
+            prefix: prefix.format(block=self.block)
+            for prefix in (_BLOCK_PREFIX, _BLOCK1_PREFIX, _ENUMS_PREFIX)
+        }
 
         for line in ex.multiline:
-            field_name, index, type_subtype = line.split(maxsplit=2)
-
-            field_type: str
-            subtype: Optional[str]
-            # Append "None" to list below so there are always at least 2 elements
-            # so we can always unpack into subtype, even if no split occurs.
-            field_type, subtype, *_ = [*type_subtype.split(maxsplit=1), None]
+            # Lines are of the form <name> <index> <type> [<subtype>]
+            parts = line.split(maxsplit=3)
+            field_name, index, field_type = parts[0], parts[1], parts[2]
+            subtype = parts[3] if len(parts) == 4 else None
 
             # Always create default FieldInfo. If necessary we will replace it later
             # with a more type-specific version.
@@ -707,13 +708,7 @@ class GetFieldInfo(Command[Dict[str, FieldInfo]]):
 
             if self.extended_metadata:
                 try:
-                    # Construct the list of type-specific generators
-                    field_generators.append(
-                        self._commands_map[(field_type, subtype)](
-                            field_name, field_type, subtype
-                        )
-                    )
-
+                    info_class, attributes = command_map[field_type][subtype]
                 except KeyError:
                     # This exception will be hit if PandA ever defines new types
                     logging.exception(
@@ -721,25 +716,57 @@ class GetFieldInfo(Command[Dict[str, FieldInfo]]):
                         f"{field_name}, cannot retrieve extended information for it."
                     )
                     # We can assume the new field will have a description though
-                    field_generators.append(
-                        self._no_attributes(field_name, field_type, subtype)
+                    info_class, attributes = FieldInfo, ()
+                commands.append(GetLine(desc_prefix + field_name))
+                for attribute in attributes:
+                    commands.append(
+                        attribute.command(
+                            prefixes[attribute.prefix] + field_name + attribute.suffix
+                        )
                     )
+                field_makers.append(
+                    (field_name, field_type, subtype, info_class, attributes)
+                )
 
             # Keep track of order of fields as returned by PandA. Important for later
             # matching descriptions back to their field.
-            unsorted[int(index)] = (field_name, field_info)
+            ordered.append((int(index), field_name, field_info))
 
-        # Dict keeps insertion order, so insert in the order the server said
-        fields = {name: field for _, (name, field) in sorted(unsorted.items())}
+        # Dict keeps insertion order, so insert in the order the server said. The
+        # server usually lists fields in this order already, so sorting is linear
+        ordered.sort(key=lambda item: item[0])
+        fields = {name: field for _, name, field in ordered}
 
         if self.extended_metadata is False:
             # Asked to not perform the requests for extra metadata.
             return fields
 
-        field_name_info: Tuple[Tuple[str, FieldInfo], ...]
-        field_name_info = yield from _zip_with_return(field_generators)
+        # Get all the descriptions and attributes in a single round trip
+        values = iter((yield from _execute_commands(*commands)))
+
+        tables: List[Tuple[str, str, Optional[str], str, List[Any]]] = []
+        table_generators: List[ExchangeGenerator] = []
+        for field_name, field_type, subtype, info_class, attributes in field_makers:
+            desc = next(values)
+            # Each field consumes its description then one value per attribute
+            args = [
+                attribute.convert(value) if attribute.convert else value
+                for attribute, value in zip(attributes, values)
+            ]
+            if info_class is TableFieldInfo:
+                # Tables need another round trip for the details of each table field
+                table_generators.append(self._table_fields(field_name, args.pop()))
+                tables.append((field_name, field_type, subtype, desc, args))
+            else:
+                fields[field_name] = info_class(field_type, subtype, desc, *args)
 
-        fields.update(field_name_info)
+        table_details = yield from _zip_with_return(table_generators)
+        for (field_name, field_type, subtype, desc, args), details in zip(
+            tables, table_details
+        ):
+            fields[field_name] = TableFieldInfo(
+                field_type, subtype, desc, *args, *details
+            )
 
         return fields
 
@@ -756,15 +783,17 @@ class GetPcapBitsLabels(Command):
         ex = Exchange("PCAP.*?")
         yield ex
         bits_fields = []
+        exchanges = []
         for line in ex.multiline:
-            split = line.split()
+            split = line.split(maxsplit=3)
             if len(split) == 4:
                 field_name, _, field_type, field_subtype = split
 
                 if field_type == "ext_out" and field_subtype == "bits":
-                    bits_fields.append(f"PCAP.{field_name}")
+                    field = "PCAP." + field_name
+                    bits_fields.append(field)
+                    exchanges.append(Exchange(field + ".BITS?"))
 
-        exchanges = [Exchange(f"{field}.BITS?") for field in bits_fields]
         yield exchanges
         bits = {field: ex.multiline for field, ex in zip(bits_fields, exchanges)}
         return bits
@@ -830,31 +859,29 @@ class GetChanges(Command[Changes]):
         ex = Exchange(f"*CHANGES{self.group.value}?")
         yield ex
         changes = Changes({}, [], [], {})
-        multivalue_get_commands: List[Tuple[str, GetMultiline]] = []
+        # The multiline fields, and the Commands to get each of their values
+        multiline_fields: List[str] = []
+        multiline_gets: List[GetMultiline] = []
         for line in ex.multiline:
-            if line[-1] == "<":
+            # A single partition classifies the line, as only values contain "="
+            field, sep, value = line.partition("=")
+            if sep:
+                changes.values[field] = value
+            elif line[-1] == "<":
                 if self.get_multiline:
                     field = line[0:-1]
-                    multivalue_get_commands.append((field, GetMultiline(field)))
+                    multiline_fields.append(field)
+                    multiline_gets.append(GetMultiline(field))
                 else:
                     changes.no_value.append(line[:-1])
-
-            elif line.endswith("(error)"):
-                changes.in_error.append(line.split(" ", 1)[0])
             else:
-                field, value = line.split("=", maxsplit=1)
-                changes.values[field] = value
+                # Line is of the form "<field> (error)"
+                changes.in_error.append(line.partition(" ")[0])
 
         if self.get_multiline:
-            multiline_vals = yield from _execute_commands(
-                *[item[1] for item in multivalue_get_commands]
-            )
+            multiline_vals = yield from _execute_commands(*multiline_gets)
 
-            for field, value in zip(
-                [item[0] for item in multivalue_get_commands], multiline_vals
-            ):
-                assert isinstance(value, list)
-                changes.multiline_values[field] = value
+            changes.multiline_values.update(zip(multiline_fields, multiline_vals))
 
         return changes
 
@@ -868,6 +895,11 @@ class GetState(Command[List[str]]):
     called using the same client. The caller should use separate clients to avoid
     potential issues.
 
+    The state is gathered in two round trips to the PandA, however many fields it
+    has. The first asks for the ``*CHANGES`` of each group that is saved, and the
+    second asks for the values of all the tables and multiline metadata reported
+    in that first response.
+
     For example::
 
         GetState() -> [
@@ -878,9 +910,12 @@ class GetState(Command[List[str]]):
         ]
     """
 
+    __slots__ = ()
+
     def execute(self) -> ExchangeGenerator[List[str]]:
-        # TODO: explain in detail how this works
-        # See: references/how-it-works
+        # First round trip: the changes for each group are independent, so send
+        # them together. ATTR, CONFIG and METADATA give single line values, while
+        # TABLE and METADATA list the multiline fields in no_value
         attr, config, table, metadata = yield from _execute_commands(
             GetChanges(ChangeGroup.ATTR),
             GetChanges(ChangeGroup.CONFIG),
@@ -888,9 +923,10 @@ class GetState(Command[List[str]]):
             GetChanges(ChangeGroup.METADATA),
         )
         # Add the single line values
-        line_values = dict(**attr.values, **config.values, **metadata.values)
+        line_values = {**attr.values, **config.values, **metadata.values}
         state = [f"{k}={v}" for k, v in line_values.items()]
-        # Get the multiline values
+        # Second round trip: get all the multiline values together. These depend
+        # on the first response, so can't be sent any earlier
         multiline_keys, commands = [], []
         for field_name in table.no_value:
             # Get tables as base64
@@ -902,7 +938,10 @@ class GetState(Command[List[str]]):
             commands.append(GetMultiline(f"{field_name}"))
         multiline_values = yield from _execute_commands(*commands)
         for k, v in zip(multiline_keys, multiline_values):
-            state += [k] + v + [""]
+            # Extend in place rather than concatenating temporary lists
+            state.append(k)
+            state.extend(v)
+            state.append("")
         return state
 
 
@@ -923,19 +962,27 @@ class SetState(Command[None]):
         ])
     """
 
+    __slots__ = ("state",)
+
     state: List[str]
 
     def execute(self) -> ExchangeGenerator[None]:
         commands: List[Raw] = []
-        command_lines: List[str] = []
-        for line in self.state:
-            command_lines.append(line)
-            first_line = len(command_lines) == 1
-            if (first_line and not is_multiline_command(line)) or not line:
-                # If not a multiline command
-                # Or blank line at the end of a multiline command
-                commands.append(Raw(command_lines))
-                command_lines = []
+        # Index of the first line of the current multiline command, if in one
+        start: Optional[int] = None
+        for i, line in enumerate(self.state):
+            if start is not None:
+                if not line:
+                    # Blank line at the end of a multiline command, so slice out
+                    # all its lines at once
+                    commands.append(Raw(self.state[start : i + 1]))
+                    start = None
+            elif is_multiline_command(line):
+                # First line of a multiline command
+                start = i
+            else:
+                # Single line command
+                commands.append(Raw([line]))
         returns = yield from _execute_commands(*commands)
         for command, ret in zip(commands, returns):
             if ret != ["OK"]:
@@ -49,6 +49,7 @@ class Buffer:
         buf = Buffer()
         buf += bytes_from_server
         line = buf.read_line()  # raises NeedMoreData if no line
+        lines = buf.read_lines()  # all complete lines as strings
         for line in buf:
             pass
         bytes = buf.read_bytes(50)  # raises NeedMoreData if not enough bytes
@@ -96,6 +97,23 @@ class Buffer:
         else:
             return self._extract_frame(idx, num_to_discard=1)
 
+    def read_lines(self) -> List[str]:
+        """Read and pop all complete newline terminated lines (without
+        terminators) from the beginning of the buffer, decoded as strings.
+        Returns an empty list if there are no complete lines"""
+        idx = self._buf.rfind(b"\n")
+        if idx < 0:
+            return []
+        else:
+            # Decode and split the whole block at once rather than line by line
+            return self._extract_frame(idx, num_to_discard=1).decode().split("\n")
+
+    def unread_lines(self, lines: List[str]):
+        """Push lines from `read_lines` back onto the beginning of the buffer,
+        for instance if they could not be processed"""
+        if lines:
+            self._buf[:0] = "".join(line + "\n" for line in lines).encode()
+
     def __iter__(self):
         return self
 
@@ -205,30 +223,37 @@ class ControlConnection:
         self._buf += received
         is_multiline = bool(self._lines)
         to_send = b""
-        for line_b in self._buf:
-            line = line_b.decode()
-            if not is_multiline:
-                # Check if we need to switch to multiline mode
-                is_multiline = line.startswith("!") or line == "."
-            if is_multiline:
-                # Add a new line to the buffer
-                self._lines.append(line)
-                if line == ".":
-                    # End of multiline mode, return what we've got
-                    to_send += self._update_contexts(self._lines, is_multiline)
-                    self._lines = []
-                    is_multiline = False
+        lines = self._buf.read_lines()
+        consumed = 0
+        try:
+            for consumed, line in enumerate(lines, 1):
+                if not is_multiline:
+                    # Check if we need to switch to multiline mode
+                    is_multiline = line.startswith("!") or line == "."
+                if is_multiline:
+                    # Add a new line to the buffer
+                    self._lines.append(line)
+                    if line == ".":
+                        # End of multiline mode, return what we've got
+                        to_send += self._update_contexts(self._lines, is_multiline)
+                        self._lines = []
+                        is_multiline = False
+                    else:
+                        # Check a correctly formatted response
+                        assert line.startswith("!"), (
+                            "Multiline response %r doesn't start with !" % line
+                        )
                 else:
-                    # Check a correctly formatted response
-                    assert line.startswith("!"), (
-                        "Multiline response %r doesn't start with !" % line
+                    # Single line mode
+                    assert not self._lines, (
+                        "Multiline response %s not terminated" % self._lines
                     )
-            else:
-                # Single line mode
-                assert not self._lines, (
-                    "Multiline response %s not terminated" % self._lines
-                )
-                to_send += self._update_contexts([line])
+                    to_send += self._update_contexts([line])
+        except Exception:
+            # Leave the lines after the one that failed in the buffer for the next
+            # call, as if they had been read one at a time
+            self._buf.unread_lines(lines[consumed:])
+            raise
         return to_send
 
     def responses(self) -> Iterator[Tuple[Command, Any]]:
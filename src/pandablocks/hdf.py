@@ -1,7 +1,9 @@
+import asyncio
 import logging
 import queue
 import threading
-from typing import Any, Callable, Dict, Iterator, List, Optional, Type
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type, Union
 
 import h5py
 import numpy as np
@@ -30,71 +32,202 @@ class HDFDataOverrunException(Exception):
 
 
 class Pipeline(threading.Thread):
-    """Helper class that runs a pipeline consumer process in its own thread"""
+    """Helper class that runs a pipeline consumer process in its own thread
+
+    Args:
+        maxsize: If greater than 0, the maximum number of items in the queue, after
+            which upstream elements wait, ``queue.put()`` blocks and
+            ``queue.put_nowait()`` raises ``queue.Full`` until the thread has
+            caught up
+    """
 
     #: Subclasses should create this dictionary with handlers for each data
     #: type, returning transformed data that should be passed downstream
     what_to_do: Dict[Type, Callable]
     downstream: Optional["Pipeline"] = None
 
-    def __init__(self):
+    def __init__(self, maxsize: int = 0):
         super().__init__()
-        self.queue: queue.Queue[Any] = queue.Queue()  # type: ignore
+        self.queue: Union[queue.Queue[Any], queue.SimpleQueue[Any]]  # type: ignore
+        if maxsize > 0:
+            self.queue = queue.Queue(maxsize)
+        else:
+            # Each queue has a single producer and consumer, so doesn't need the
+            # task tracking of queue.Queue. SimpleQueue is implemented in C, making
+            # puts and gets much cheaper
+            self.queue = queue.SimpleQueue()
+
+    def handle(self, data: Any) -> Any:
+        """Transform data with the handler for its type, returning it unchanged
+        if there isn't one. Used by `run`, but can also be called directly to
+        use the element without its thread"""
+        func = self.what_to_do.get(type(data), None)
+        if func:
+            return func(data)
+        else:
+            return data
+
+    def next_data(self) -> Any:
+        """Return the next item from the queue, waiting for it if there isn't one.
+        Subclasses can override this to do work while waiting"""
+        return self.queue.get()
 
     def run(self):
         while True:
-            data = self.queue.get()
+            data = self.next_data()
             if data is None:
                 # stop() called below
                 break
             else:
-                func = self.what_to_do.get(type(data), None)
-                if func:
-                    # If we have a handler, use it to transform the data
-                    data = func(data)
+                data = self.handle(data)
                 if self.downstream:
-                    # Pass the (possibly transformed) data downstream
-                    self.downstream.queue.put_nowait(data)
+                    # Pass the (possibly transformed) data downstream, waiting
+                    # for it to catch up if its queue is bounded
+                    if not self.downstream._put(data):
+                        raise RuntimeError(_died(self.downstream))
+
+    def _put(self, data: Any) -> bool:
+        # Put data on the queue, waiting for room if it is bounded unless the
+        # thread has died, as then nothing will ever make room. Return whether
+        # the data was put
+        while True:
+            try:
+                self.queue.put(data, timeout=0.1)
+                return True
+            except queue.Full:
+                if not self.is_alive():
+                    return False
 
     def stop(self):
         """Stop the processing after the current queue has been emptied"""
-        self.queue.put(None)
+        # If the thread has died there is nothing left to stop
+        self._put(None)
+
+
+def _died(element: Pipeline) -> str:
+    return f"{type(element).__name__} thread died, see its logged error"
+
+
+# Placeholder for FrameProcessor arrays while there is no frame being scaled
+_NO_DATA = np.empty((0, 0))
+
+
+def _is_scaled(field: FieldCapture, raw: bool) -> bool:
+    # Whether FrameProcessor will scale the field to float64, rather than passing
+    # it through unchanged
+    return raw and (field.capture == "Mean" or field.scale != 1 or field.offset != 0)
+
+
+def _output_dtype(field: FieldCapture, raw: bool) -> np.dtype:
+    # The datatype of the field after it has been through FrameProcessor
+    if _is_scaled(field, raw):
+        # Processor outputs a float
+        return np.dtype("float64")
+    else:
+        # No processor, datatype passed through
+        return field.type
+
+
+def _records_dtype(fields: List[FieldCapture], raw: bool) -> np.dtype:
+    # The datatype of records holding every field after FrameProcessor
+    return np.dtype(
+        [
+            (f"{field.name}.{field.capture}", _output_dtype(field, raw))
+            for field in fields
+        ]
+    )
 
 
 class HDFWriter(Pipeline):
-    """Write an HDF file per data collection. Each field will be
-    written in a 1D dataset ``/<field.name>.<field.capture>``.
+    """Write an HDF file per data collection. With the default ``per_field`` layout
+    each field will be written in a 1D dataset ``/<field.name>.<field.capture>``,
+    which is quickest to read a single field from. With the ``combined`` layout all
+    fields are written to a single 1D dataset ``/data`` of records, with a member
+    ``<field.name>.<field.capture>`` per field, which is quickest to read all the
+    fields from, at the cost of interleaving each frame's columns before writing.
+
+    Rows are buffered until a whole chunk of a dataset is ready, so that HDF5
+    never has to read back and rewrite a partially filled chunk. Every
+    ``flush_period`` the partially filled chunks are written too and the file is
+    flushed, even if no more frames arrive, so SWMR readers see each row within
+    about ``flush_period`` of it arriving.
 
     Args:
         file_names: Iterator of file names. Must be full file paths. Will be called once
             per file created.
+        chunk_rows: The number of rows in each chunk of a dataset. If not given it
+            is calculated from the datatype so each chunk is ``chunk_bytes`` long.
+            Each dataset takes at least a chunk on disk, and a chunk of memory
+            to buffer its rows, so smaller chunks suit small acquisitions and many
+            fields, while larger chunks write faster.
+        layout: Either ``per_field`` or ``combined``, as described above
+        flush_period: The time in seconds between flushes of the file while writing
+        maxsize: The maximum number of items to queue, as in `Pipeline`
     """
 
-    def __init__(self, file_names: Iterator[str]):
-        super().__init__()
+    #: The size in bytes that each chunk of a dataset should be by default
+    chunk_bytes = 64 * 1024
+
+    def __init__(
+        self,
+        file_names: Iterator[str],
+        chunk_rows: Optional[int] = None,
+        layout: str = "per_field",
+        flush_period: float = 1.0,
+        maxsize: int = 0,
+    ):
+        super().__init__(maxsize)
+        if layout not in ("per_field", "combined"):
+            raise ValueError(f"Unknown HDF layout '{layout}'")
         self.file_names = file_names
+        self.chunk_rows = chunk_rows
+        self.layout = layout
+        self.flush_period = flush_period
         self.hdf_file: Optional[h5py.File] = None
         self.datasets: List[h5py.Dataset] = []
+        # A chunk sized buffer for each dataset, and how many rows are in it
+        self.pending: List[np.ndarray] = []
+        self.pending_rows: List[int] = []
+        # How many rows of each dataset have been written in whole chunks, cached
+        # to save asking HDF5 for the dataset shape
+        self.written: List[int] = []
+        self.last_flush = 0.0
+        # Whether rows have been added to the file since it was last flushed
+        self.unflushed = False
         self.what_to_do = {
             StartData: self.open_file,
             list: self.write_frame,
             EndData: self.close_file,
         }
 
+    def _chunk_rows(self, dtype: np.dtype) -> int:
+        if self.chunk_rows:
+            return self.chunk_rows
+        else:
+            return max(1024, self.chunk_bytes // dtype.itemsize)
+
     def create_dataset(self, field: FieldCapture, raw: bool):
         # Data written in a big stack, growing in that dimension
         assert self.hdf_file, "File not open yet"
-        if raw and (field.capture == "Mean" or field.scale != 1 or field.offset != 0):
-            # Processor outputs a float
-            dtype = np.dtype("float64")
-        else:
-            # No processor, datatype passed through
-            dtype = field.type
+        dtype = _output_dtype(field, raw)
         return self.hdf_file.create_dataset(
             f"/{field.name}.{field.capture}",
             dtype=dtype,
             shape=(0,),
             maxshape=(None,),
+            chunks=(self._chunk_rows(dtype),),
+        )
+
+    def create_combined_dataset(self, fields: List[FieldCapture], raw: bool):
+        # Records of every field written in a big stack, growing in that dimension
+        assert self.hdf_file, "File not open yet"
+        dtype = _records_dtype(fields, raw)
+        return self.hdf_file.create_dataset(
+            "/data",
+            dtype=dtype,
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(self._chunk_rows(dtype),),
         )
 
     def open_file(self, data: StartData):
@@ -107,23 +240,120 @@ class HDFWriter(Pipeline):
             raise
         self.hdf_file = h5py.File(self.file_path, "w", libver="latest")
         raw = data.process == "Raw"
-        self.datasets = [self.create_dataset(field, raw) for field in data.fields]
+        if self.layout == "combined":
+            self.datasets = [self.create_combined_dataset(data.fields, raw)]
+        else:
+            self.datasets = [self.create_dataset(field, raw) for field in data.fields]
+        self.pending = [np.zeros(ds.chunks, dtype=ds.dtype) for ds in self.datasets]
+        self.pending_rows = [0] * len(self.datasets)
+        self.written = [0] * len(self.datasets)
         self.hdf_file.swmr_mode = True
+        self.last_flush = time.monotonic()
         logging.info(
             f"Opened '{self.file_path}' with {data.sample_bytes} byte samples "
             f"stored in {len(self.datasets)} datasets"
         )
 
+    def _append_chunks(self, i: int, rows: np.ndarray):
+        # Rows are a whole number of chunks, and the dataset has only been written
+        # in whole chunks apart from any partial chunk written by _write_pending,
+        # which these rows will overwrite. This means we can write each chunk's
+        # bytes straight into the file without HDF5's selection and conversion
+        # machinery
+        dataset, written = self.datasets[i], self.written[i]
+        chunk_rows = self.pending[i].shape[0]
+        dsid = dataset.id
+        dsid.set_extent((written + rows.shape[0],))
+        rows = np.ascontiguousarray(rows, dtype=dataset.dtype)
+        for start in range(0, rows.shape[0], chunk_rows):
+            chunk = rows[start : start + chunk_rows]
+            dsid.write_direct_chunk((written + start,), chunk)
+        self.written[i] = written + rows.shape[0]
+
+    def _write_pending(self, i: int):
+        # Write the partially filled chunk so its rows are in the file. The rows
+        # after it are not part of the dataset, and the chunk will be overwritten
+        # when it is complete
+        filled = self.pending_rows[i]
+        if filled:
+            dsid, written = self.datasets[i].id, self.written[i]
+            dsid.set_extent((written + filled,))
+            dsid.write_direct_chunk((written,), self.pending[i])
+
+    def _flush(self):
+        assert self.hdf_file, "File not open yet"
+        for i in range(len(self.datasets)):
+            self._write_pending(i)
+        self.hdf_file.flush()
+        self.last_flush = time.monotonic()
+        self.unflushed = False
+
+    def _write_column(self, i: int, column: np.ndarray):
+        # Write the whole chunks that column completes or contains, leaving the
+        # remaining rows in the pending buffer
+        pending = self.pending[i]
+        chunk_rows = pending.shape[0]
+        filled = self.pending_rows[i]
+        start, total = 0, column.shape[0]
+        while start < total:
+            if filled == 0 and total - start >= chunk_rows:
+                # Write as many whole chunks as we can straight from the column
+                end = start + (total - start) // chunk_rows * chunk_rows
+                self._append_chunks(i, column[start:end])
+                start = end
+            else:
+                # Top up the pending buffer, writing it if it is now full
+                end = min(start + chunk_rows - filled, total)
+                pending[filled : filled + end - start] = column[start:end]
+                filled += end - start
+                start = end
+                if filled == chunk_rows:
+                    self._append_chunks(i, pending)
+                    filled = 0
+        self.pending_rows[i] = filled
+
     def write_frame(self, data: List[np.ndarray]):
-        for dataset, column in zip(self.datasets, data):
-            # Append to the end, flush when done
-            written = dataset.shape[0]
-            dataset.resize((written + column.shape[0],))
-            dataset[written:] = column
-            dataset.flush()
+        if self.layout == "combined" and data:
+            # Interleave the columns into records for the single dataset
+            records = np.empty(data[0].shape[0], dtype=self.datasets[0].dtype)
+            for name, column in zip(records.dtype.names, data):
+                records[name] = column
+            data = [records]
+        pending_rows = self.pending_rows
+        for i, (pending, column) in enumerate(zip(self.pending, data)):
+            filled = pending_rows[i]
+            end = filled + column.shape[0]
+            if end < pending.shape[0]:
+                # Most frames fit in the pending buffer without filling it
+                pending[filled:end] = column
+                pending_rows[i] = end
+            else:
+                self._write_column(i, column)
+        # Make the rows visible to SWMR readers every flush_period, even if there
+        # is a backlog of frames queued. If not, next_data flushes them later
+        if time.monotonic() - self.last_flush >= self.flush_period:
+            self._flush()
+        else:
+            self.unflushed = True
+
+    def next_data(self) -> Any:
+        # If no more data arrives by the time the unflushed rows are due to be
+        # flushed, flush them anyway rather than leaving them invisible
+        while self.unflushed:
+            timeout = self.last_flush + self.flush_period - time.monotonic()
+            try:
+                return self.queue.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                self._flush()
+        return self.queue.get()
 
     def close_file(self, data: EndData):
         assert self.hdf_file, "File not open yet"
+        # Write out the partially filled chunks
+        self._flush()
+        self.pending = []
+        self.pending_rows = []
+        self.written = []
         self.hdf_file.close()
         self.hdf_file = None
         logging.info(
@@ -139,6 +369,14 @@ class FrameProcessor(Pipeline):
     def __init__(self) -> None:
         super().__init__()
         self.processors: List[Callable] = []
+        # How many scaled fields processors have been created for, and whether any
+        # of them need the samples, so scale_data can prepare them for each frame
+        self.num_scaled = 0
+        self.has_mean = False
+        # The float64 output rows of the scaled fields and the samples as float64
+        # for the frame being scaled
+        self.outs = _NO_DATA
+        self.samples = _NO_DATA
         self.what_to_do = {
             StartData: self.create_processors,
             FrameData: self.scale_data,
@@ -146,35 +384,65 @@ class FrameProcessor(Pipeline):
 
     def create_processor(self, field: FieldCapture, raw: bool):
         column_name = f"{field.name}.{field.capture}"
-        if raw and field.capture == "Mean":
-            return (
-                lambda data: data[column_name] * field.scale / data[SAMPLES_FIELD]
-                + field.offset
-            )
-        elif raw and (field.scale != 1 or field.offset != 0):
-            return lambda data: data[column_name] * field.scale + field.offset
-        else:
+        if not _is_scaled(field, raw):
             return lambda data: data[column_name]
+        scale, offset, mean = field.scale, field.offset, field.capture == "Mean"
+        # Each scaled field writes its float64 output into its own row of a block
+        # that scale_data allocates for the frame, doing the arithmetic in place
+        # rather than making a temporary array per operation, and skipping
+        # operations that would leave the values unchanged
+        index = self.num_scaled
+        self.num_scaled += 1
+        self.has_mean |= mean
+
+        def process(data: np.ndarray) -> np.ndarray:
+            out = self.outs[index]
+            np.copyto(out, data[column_name], casting="unsafe")
+            if scale != 1:
+                np.multiply(out, scale, out=out)
+            if mean:
+                np.divide(out, self.samples, out=out)
+            if offset != 0:
+                np.add(out, offset, out=out)
+            return out
+
+        return process
 
     def create_processors(self, data: StartData) -> StartData:
         raw = data.process == "Raw"
+        self.num_scaled = 0
+        self.has_mean = False
         self.processors = [self.create_processor(field, raw) for field in data.fields]
         return data
 
     def scale_data(self, data: FrameData) -> List[np.ndarray]:
-        return [process(data.data) for process in self.processors]
+        # Allocate the output of all the scaled fields in a single block, which is
+        # much cheaper than an array per field. It can't be reused for the next
+        # frame as the writer may not have written it yet
+        self.outs = np.empty((self.num_scaled, len(data.data)))
+        # Each Mean field divides by the samples, so make a contiguous float64 copy
+        # of them once rather than each field reading them from the strided records
+        if self.has_mean:
+            self.samples = data.data[SAMPLES_FIELD].astype(np.float64)
+        processed = [process(data.data) for process in self.processors]
+        # Don't keep the frame's data alive after it has been passed on
+        self.outs = self.samples = _NO_DATA
+        return processed
 
 
 def create_default_pipeline(
     file_names: Iterator[str],
+    chunk_rows: Optional[int] = None,
 ) -> List[Pipeline]:
     """Create the default processing pipeline consisting of one `FrameProcessor` and
     one `HDFWriter`. See `create_pipeline` for more details.
 
     Args:
         file_names: Iterator of file names. Must be full file paths. Will be called once
-            per file created. As required by `HDFWriter`."""
-    return create_pipeline(FrameProcessor(), HDFWriter(file_names))
+            per file created. As required by `HDFWriter`.
+        chunk_rows: The number of rows in each chunk of a dataset, as in
+            `HDFWriter`"""
+    return create_pipeline(FrameProcessor(), HDFWriter(file_names, chunk_rows))
 
 
 def create_pipeline(*elements: Pipeline) -> List[Pipeline]:
@@ -199,12 +467,20 @@ def stop_pipeline(pipeline: List[Pipeline]):
         element.join()
 
 
+async def _wait_to_put(element: Pipeline, data: Any):
+    # Wait for room in the element's bounded queue without blocking the event loop
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, element._put, data):
+        raise RuntimeError(_died(element))
+
+
 async def write_hdf_files(
     client: AsyncioClient,
     file_names: Iterator[str],
     num: int = 1,
     arm: bool = False,
     flush_period: float = 1,
+    chunk_rows: Optional[int] = None,
 ):
     """Connect to host PandA data port, and write num acquisitions
     to HDF file according to scheme
@@ -215,16 +491,35 @@ async def write_hdf_files(
             per file created.
         num: The number of acquisitions to store in separate files. 0 = Infinite capture
         arm: Whether to arm PCAP at the start, and after each successful acquisition
+        flush_period: The time in seconds to squash frames together for, and
+            between flushes of the file
+        chunk_rows: The number of rows in each chunk of a dataset, as in
+            `HDFWriter`
 
     Raises:
         HDFDataOverrunException: if there is a data overrun.
+        RuntimeError: if the `HDFWriter` thread dies, for instance because a file
+            can't be created.
     """
     counter = 0
     end_data = None
-    pipeline = create_default_pipeline(file_names)
+    # Scaling is cheap numpy work, so do it here rather than paying for an extra
+    # thread and queue hop, and leave the HDF5 I/O to the writer's thread
+    processor = FrameProcessor()
+    # Bound the writer's queue so that if it can't keep up we stop reading from the
+    # PandA rather than queueing ever more data in memory. Each frame holds
+    # flush_period worth of data
+    pipeline = create_pipeline(
+        HDFWriter(file_names, chunk_rows, flush_period=flush_period, maxsize=4)
+    )
     try:
         async for data in client.data(scaled=False, flush_period=flush_period):
-            pipeline[0].queue.put_nowait(data)
+            processed = processor.handle(data)
+            try:
+                pipeline[0].queue.put_nowait(processed)
+            except queue.Full:
+                # Wait for the writer to catch up
+                await _wait_to_put(pipeline[0], processed)
             if type(data) == EndData:
                 end_data = data
                 counter += 1
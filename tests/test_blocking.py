@@ -12,6 +12,14 @@ def test_blocking_get(dummy_server_in_thread):
     assert dummy_server_in_thread.received == ["PCAP.ACTIVE?"]
 
 
+def test_blocking_send_multiple(dummy_server_in_thread):
+    dummy_server_in_thread.send += ["OK =something", "OK"]
+    with BlockingClient("localhost") as client:
+        responses = client.send([Get("PCAP.ACTIVE"), Put("SEQ1.REPEATS", 2)], 1)
+    assert responses == ["something", None]
+    assert dummy_server_in_thread.received == ["PCAP.ACTIVE?", "SEQ1.REPEATS=2"]
+
+
 def test_blocking_bad_put_raises(dummy_server_in_thread):
     dummy_server_in_thread.send.append("ERR no such field")
     with BlockingClient("localhost") as client:
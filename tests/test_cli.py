@@ -42,11 +42,13 @@ def test_writing_overrun_hdf(
     dummy_server_in_thread.data = [overrun_dump]
     runner = CliRunner()
     result = runner.invoke(
-        cli.cli, ["hdf", "localhost", str(tmp_path / "%d.h5"), "--arm"]
+        cli.cli,
+        ["hdf", "localhost", str(tmp_path / "%d.h5"), "--arm", "--chunk-rows=1000"],
     )
     assert result.exit_code == 1
     assert isinstance(result.exception, HDFDataOverrunException)
     hdf_file = h5py.File(tmp_path / "1.h5", "r")
+    assert hdf_file["/PCAP.TS_START.Value"].chunks == (1000,)
     assert_all_data_in_hdf_file(hdf_file)
 
 
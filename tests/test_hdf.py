@@ -0,0 +1,304 @@
+import asyncio
+import queue
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from pandablocks import hdf
+from pandablocks.hdf import (
+    FrameProcessor,
+    HDFWriter,
+    Pipeline,
+    create_pipeline,
+    stop_pipeline,
+    write_hdf_files,
+)
+from pandablocks.responses import (
+    EndData,
+    EndReason,
+    FieldCapture,
+    FrameData,
+    ReadyData,
+    StartData,
+)
+
+
+def make_start_data(*fields: FieldCapture, process="Scaled") -> StartData:
+    return StartData(
+        fields=list(fields),
+        missed=0,
+        process=process,
+        format="Framed",
+        sample_bytes=sum(field.type.itemsize for field in fields),
+    )
+
+
+@pytest.fixture
+def file_path(tmp_path) -> str:
+    return str(tmp_path / "1.h5")
+
+
+@pytest.fixture
+def open_writer(file_path):
+    # Make an HDFWriter with the given arguments, and open file_path with it to
+    # write an int32 and a float64 field
+    def open_writer(**kwargs) -> HDFWriter:
+        writer = HDFWriter(iter([file_path]), **kwargs)
+        writer.open_file(
+            make_start_data(
+                FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Value"),
+                FieldCapture("PCAP.TS_START", np.dtype("float64"), "Value"),
+            )
+        )
+        return writer
+
+    return open_writer
+
+
+def test_hdf_writer_chunk_boundaries(file_path, open_writer, monkeypatch):
+    # 2048 rows of int32, 1024 rows of float64 per chunk
+    monkeypatch.setattr(HDFWriter, "chunk_bytes", 8192)
+    writer = open_writer(flush_period=1000)
+    assert [ds.chunks for ds in writer.datasets] == [(2048,), (1024,)]
+    expected = np.arange(30 * 256)
+    # Frames smaller than, straddling and spanning multiple chunks
+    for start, end in [(0, 768), (768, 1024), (1024, 3328), (3328, 7424), (7424, 7680)]:
+        writer.write_frame(
+            [expected[start:end].astype("int32"), expected[start:end] * 0.5]
+        )
+        # Only whole chunks are written while acquiring
+        assert writer.datasets[0].shape == (end // 2048 * 2048,)
+        assert writer.datasets[1].shape == (end // 1024 * 1024,)
+    writer.close_file(EndData(7680, EndReason.OK))
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:] == pytest.approx(expected)
+        assert hdf_file["/PCAP.TS_START.Value"][:] == pytest.approx(expected * 0.5)
+
+
+def test_hdf_writer_chunk_rows(file_path, open_writer):
+    writer = open_writer(chunk_rows=5, flush_period=1000)
+    assert [ds.chunks for ds in writer.datasets] == [(5,), (5,)]
+    writer.write_frame([np.arange(7, dtype="int32"), np.arange(7) * 0.5])
+    assert [ds.shape for ds in writer.datasets] == [(5,), (5,)]
+    writer.close_file(EndData(7, EndReason.OK))
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:] == pytest.approx(np.arange(7))
+
+
+def test_frame_processor_handle():
+    processor = FrameProcessor()
+    start_data = make_start_data(
+        FieldCapture("PCAP.SAMPLES", np.dtype("uint32"), "Value"),
+        FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Mean", scale=2, offset=1),
+        FieldCapture("COUNTER2.OUT", np.dtype("int32"), "Value", scale=0.5),
+        FieldCapture("COUNTER3.OUT", np.dtype("int32"), "Max"),
+        FieldCapture("COUNTER4.OUT", np.dtype("int32"), "Mean"),
+        FieldCapture("COUNTER5.OUT", np.dtype("int32"), "Value", offset=-1),
+        process="Raw",
+    )
+    ready_data = ReadyData()
+    # Data without a handler passes straight through
+    assert processor.handle(ready_data) is ready_data
+    assert processor.handle(start_data) is start_data
+    data = np.array(
+        [(4, 8, 3, 5, 6, 1), (2, 6, 4, 7, 3, 2)],
+        dtype=[(f"{f.name}.{f.capture}", f.type) for f in start_data.fields],
+    )
+    samples, mean, value, max_, plain_mean, offset = processor.handle(FrameData(data))
+    assert samples.tolist() == [4, 2]
+    assert mean.tolist() == [5.0, 7.0]
+    assert value.tolist() == [1.5, 2.0]
+    assert max_.tolist() == [5, 7]
+    assert max_.dtype == np.dtype("int32")
+    assert plain_mean.tolist() == [1.5, 1.5]
+    assert offset.tolist() == [0.0, 1.0]
+
+
+def test_frame_processor_create_processor_override():
+    class NegatingProcessor(FrameProcessor):
+        def create_processor(self, field: FieldCapture, raw: bool):
+            if field.name == "COUNTER1.OUT":
+                return lambda data: -data["COUNTER1.OUT.Mean"]
+            return super().create_processor(field, raw)
+
+    processor = NegatingProcessor()
+    start_data = make_start_data(
+        FieldCapture("PCAP.SAMPLES", np.dtype("uint32"), "Value"),
+        FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Mean", scale=2),
+        FieldCapture("COUNTER2.OUT", np.dtype("int32"), "Mean", scale=2),
+        process="Raw",
+    )
+    processor.handle(start_data)
+    data = np.array(
+        [(4, 8, 8), (2, 6, 6)],
+        dtype=[(f"{f.name}.{f.capture}", f.type) for f in start_data.fields],
+    )
+    # Processors still take just the frame's data, and overriding one doesn't
+    # disturb the outputs of the others
+    samples, negated, mean = processor.handle(FrameData(data))
+    assert negated.tolist() == [-8, -6]
+    assert mean.tolist() == [4.0, 6.0]
+
+
+def test_hdf_writer_flush_period(file_path):
+    writer = HDFWriter(iter([file_path]), chunk_rows=4, flush_period=1000)
+    writer.open_file(
+        make_start_data(FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Value"))
+    )
+    # Flushed recently, so flushing waits
+    writer.write_frame([np.arange(3, dtype="int32")])
+    assert writer.datasets[0].shape == (0,)
+    assert writer.unflushed
+    # Whole chunk and partial chunk written, even with another frame queued
+    writer.flush_period = 0
+    writer.queue.put_nowait([np.arange(5, 9, dtype="int32")])
+    writer.write_frame([np.arange(3, 5, dtype="int32")])
+    assert writer.datasets[0].shape == (5,)
+    assert not writer.unflushed
+    # Partial chunk overwritten by the whole chunk, and a new partial chunk written
+    writer.write_frame(writer.queue.get())
+    assert writer.datasets[0].shape == (9,)
+    assert writer.datasets[0][:].tolist() == list(range(9))
+    writer.close_file(EndData(9, EndReason.OK))
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:].tolist() == list(range(9))
+
+
+def test_hdf_writer_flushes_when_idle(file_path):
+    writer = HDFWriter(iter([file_path]), chunk_rows=4, flush_period=0.1)
+    writer.start()
+    writer.queue.put_nowait(
+        make_start_data(FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Value"))
+    )
+    writer.queue.put_nowait([np.arange(3, dtype="int32")])
+    # No more frames arrive, but the rows are still flushed
+    deadline = time.monotonic() + 10
+    while not (writer.datasets and writer.datasets[0].shape == (3,)):
+        assert time.monotonic() < deadline, "Rows were not flushed"
+        time.sleep(0.01)
+    writer.queue.put_nowait(EndData(3, EndReason.OK))
+    writer.stop()
+    writer.join()
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:].tolist() == list(range(3))
+
+
+def test_hdf_writer_combined_layout(file_path, open_writer):
+    writer = open_writer(chunk_rows=4, layout="combined")
+    for start, end in [(0, 3), (3, 10), (10, 11)]:
+        rows = np.arange(start, end)
+        writer.write_frame([rows.astype("int32"), rows * 0.5])
+    writer.close_file(EndData(11, EndReason.OK))
+    with h5py.File(file_path, "r") as hdf_file:
+        assert list(hdf_file) == ["data"]
+        data = hdf_file["/data"][:]
+        assert data.dtype.names == ("COUNTER1.OUT.Value", "PCAP.TS_START.Value")
+        assert data["COUNTER1.OUT.Value"].tolist() == list(range(11))
+        assert data["PCAP.TS_START.Value"] == pytest.approx(np.arange(11) * 0.5)
+
+
+def test_hdf_writer_bad_layout():
+    with pytest.raises(ValueError, match="Unknown HDF layout 'rows'"):
+        HDFWriter(iter([]), layout="rows")
+
+
+def test_hdf_writer_strided_columns(file_path, open_writer):
+    writer = open_writer(chunk_rows=4)
+    # Pass-through fields arrive as strided views into the frame's records, and
+    # may not match the dataset's byte order
+    records = np.zeros(10, dtype=[("a", ">i4"), ("b", "<f8")])
+    records["a"] = np.arange(10)
+    records["b"] = np.arange(10) * 0.5
+    writer.write_frame([records["a"], records["b"]])
+    writer.close_file(EndData(10, EndReason.OK))
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:].tolist() == list(range(10))
+        assert hdf_file["/PCAP.TS_START.Value"][:] == pytest.approx(np.arange(10) * 0.5)
+
+
+def test_hdf_writer_bounded_queue():
+    writer = HDFWriter(iter([]), maxsize=1)
+    writer.queue.put_nowait(ReadyData())
+    with pytest.raises(queue.Full):
+        writer.queue.put_nowait(ReadyData())
+    # Unbounded by default
+    writer = HDFWriter(iter([]))
+    for _ in range(10):
+        writer.queue.put_nowait(ReadyData())
+
+
+def test_pipeline_bounded_downstream():
+    received = []
+
+    class Source(Pipeline):
+        what_to_do = {int: lambda data: data * 2}
+
+    class Slow(Pipeline):
+        def __init__(self):
+            super().__init__(maxsize=1)
+            self.what_to_do = {int: self.receive}
+
+        def receive(self, data: int):
+            time.sleep(0.01)
+            received.append(data)
+
+    source, slow = create_pipeline(Source(), Slow())
+    for i in range(10):
+        source.queue.put_nowait(i)
+    stop_pipeline([source, slow])
+    # The source waited for the slow element rather than dying with queue.Full
+    assert received == [i * 2 for i in range(10)]
+
+
+class FrameClient:
+    # Just enough of AsyncioClient for write_hdf_files, producing num frames of
+    # 10 rows each as fast as they are asked for
+    def __init__(self, num: int):
+        self.num = num
+        self.start_data = make_start_data(
+            FieldCapture("COUNTER1.OUT", np.dtype("int32"), "Value"), process="Raw"
+        )
+
+    async def data(self, scaled: bool, flush_period: float):
+        yield self.start_data
+        for i in range(self.num):
+            rows = np.arange(i * 10, i * 10 + 10, dtype="int32")
+            yield FrameData(rows.astype([("COUNTER1.OUT.Value", "int32")]))
+        yield EndData(self.num * 10, EndReason.OK)
+
+    async def send(self, command):
+        pass
+
+
+async def test_write_hdf_files_waits_for_writer(file_path, monkeypatch):
+    write_frame = HDFWriter.write_frame
+
+    def slow_write_frame(self, data):
+        time.sleep(0.01)
+        write_frame(self, data)
+
+    waits = []
+    wait_to_put = hdf._wait_to_put
+
+    async def counting_wait_to_put(element, data):
+        waits.append(data)
+        await wait_to_put(element, data)
+
+    monkeypatch.setattr(HDFWriter, "write_frame", slow_write_frame)
+    monkeypatch.setattr(hdf, "_wait_to_put", counting_wait_to_put)
+    await asyncio.wait_for(write_hdf_files(FrameClient(20), iter([file_path])), 10)
+    # The writer couldn't keep up, so its queue filled
+    assert waits
+    with h5py.File(file_path, "r") as hdf_file:
+        assert hdf_file["/COUNTER1.OUT.Value"][:].tolist() == list(range(200))
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+async def test_write_hdf_files_writer_died(tmp_path):
+    file_names = iter([str(tmp_path / "nonexistent" / "1.h5")])
+    # The writer dies opening the file, so once its queue is full we give up
+    # rather than waiting for room forever
+    with pytest.raises(RuntimeError, match="HDFWriter thread died"):
+        await asyncio.wait_for(write_hdf_files(FrameClient(20), file_names), 10)
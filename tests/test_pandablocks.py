@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from typing import Iterator, OrderedDict
 
 import pytest
@@ -5,6 +6,7 @@ import pytest
 from pandablocks.commands import (
     Append,
     ChangeGroup,
+    Command,
     CommandException,
     Get,
     GetBlockInfo,
@@ -16,6 +18,7 @@ from pandablocks.commands import (
     GetState,
     Put,
     SetState,
+    _execute_commands,
     is_multiline_command,
 )
 from pandablocks.connections import (
@@ -58,6 +61,15 @@ def test_connection_gets_split_value():
     assert get_responses(conn, b"\nAnySpamWeLike") == [(cmd, "1")]
 
 
+def test_connection_gets_split_utf8_value():
+    conn = ControlConnection()
+    cmd = Get("*METADATA.DESIGN")
+    assert conn.send(cmd) == b"*METADATA.DESIGN?\n"
+    encoded = "OK =Caf\u00e9\n".encode()
+    assert not get_responses(conn, encoded[:-2])
+    assert get_responses(conn, encoded[-2:]) == [(cmd, "Caf\u00e9")]
+
+
 def test_connection_gets_muliline():
     conn = ControlConnection()
     cmd = Get("SEQ1.TABLE")
@@ -75,6 +87,23 @@ def test_get_line():
     assert get_responses(conn, b"OK =1\n") == [(cmd, "1")]
 
 
+def test_batched_commands_use_execute_overrides():
+    class UpperGetLine(GetLine):
+        def execute(self):
+            value = yield from super().execute()
+            return value.upper()
+
+    @dataclass
+    class Batch(Command[tuple]):
+        def execute(self):
+            return (yield from _execute_commands(UpperGetLine("A"), GetLine("B")))
+
+    conn = ControlConnection()
+    cmd = Batch()
+    assert conn.send(cmd) == b"A?\nB?\n"
+    assert get_responses(conn, b"OK =x\nOK =y\n") == [(cmd, ("X", "y"))]
+
+
 def test_get_line_error_when_multiline():
     conn = ControlConnection()
     cmd = GetLine("PCAP.ACTIVE")
@@ -253,6 +282,31 @@ def test_get_block_info_skip_description():
     assert get_responses(conn, b"!PCAP 1\n.\n") == [(cmd, ordered_dict)]
 
 
+def test_get_block_info_description_cache():
+    """Test that descriptions in the description_cache are not retrieved again"""
+    cache = {"PCAP": "Description for PCAP field"}
+    conn = ControlConnection()
+    cmd = GetBlockInfo(description_cache=cache)
+    assert conn.send(cmd) == b"*BLOCKS?\n"
+
+    # Only the block that isn't in the cache has its description retrieved
+    assert conn.receive_bytes(b"!PCAP 1\n!LUT 8\n.\n") == b"*DESC.LUT?\n"
+
+    expected = {
+        "LUT": BlockInfo(number=8, description="Description for LUT field"),
+        "PCAP": BlockInfo(number=1, description="Description for PCAP field"),
+    }
+    assert get_responses(conn, b"OK =Description for LUT field\n") == [(cmd, expected)]
+    assert cache == {
+        "LUT": "Description for LUT field",
+        "PCAP": "Description for PCAP field",
+    }
+
+    # Now everything is cached, so no descriptions are retrieved at all
+    assert conn.send(cmd) == b"*BLOCKS?\n"
+    assert get_responses(conn, b"!PCAP 1\n!LUT 8\n.\n") == [(cmd, expected)]
+
+
 def test_get_block_info_error():
     """Test that any errors from *BLOCKS command are correctly reported"""
     conn = ControlConnection()
@@ -971,6 +1025,61 @@ def test_get_fields_type_table():
     ]
 
 
+def test_get_fields_table_with_other_fields():
+    """Test that the attributes of all fields, including tables, are requested
+    together before the details of the table fields are requested"""
+    conn = ControlConnection()
+    cmd = GetFieldInfo("SEQ")
+    assert conn.send(cmd) == b"SEQ.*?\n"
+
+    assert (
+        conn.receive_bytes(b"!TABLE 7 table\n!REPEATS 1 param uint\n.\n")
+        == b"*DESC.SEQ.TABLE?\nSEQ1.TABLE.MAX_LENGTH?\nSEQ1.TABLE.FIELDS?\n"
+        b"*DESC.SEQ.REPEATS?\nSEQ1.REPEATS.MAX?\n"
+    )
+
+    responses = [
+        b"OK =Sequencer table of lines\n",
+        b"OK =16384\n",
+        b"!15:0 REPEATS uint\n.\n",
+        b"OK =Number of times the table will repeat\n",
+    ]
+    for response in responses:
+        assert conn.receive_bytes(response) == b""
+
+    assert conn.receive_bytes(b"OK =100\n") == b"*DESC.SEQ1.TABLE[].REPEATS?\n"
+
+    assert get_responses(conn, b"OK =Number of times the line will repeat\n") == [
+        (
+            cmd,
+            {
+                "REPEATS": UintFieldInfo(
+                    type="param",
+                    subtype="uint",
+                    description="Number of times the table will repeat",
+                    max_val=100,
+                ),
+                "TABLE": TableFieldInfo(
+                    type="table",
+                    subtype=None,
+                    description="Sequencer table of lines",
+                    max_length=16384,
+                    row_words=1,
+                    fields={
+                        "REPEATS": TableFieldDetails(
+                            subtype="uint",
+                            bit_low=0,
+                            bit_high=15,
+                            description="Number of times the line will repeat",
+                            labels=None,
+                        ),
+                    },
+                ),
+            },
+        )
+    ]
+
+
 def test_get_pcap_bits_labels():
     """Simple working testcase for GetPcapBitsLabels"""
 
@@ -1060,6 +1169,16 @@ def test_expected_exception_when_receive_without_send():
         conn.receive_bytes(b"abc\n")
 
 
+def test_lines_after_failed_line_stay_buffered():
+    conn = ControlConnection()
+    with pytest.raises(NoContextAvailable):
+        conn.receive_bytes(b"abc\nOK =1\n")
+    # The line after the one that failed is processed on the next receive
+    cmd = Get("PCAP.ACTIVE")
+    assert conn.send(cmd) == b"PCAP.ACTIVE?\n"
+    assert get_responses(conn, b"") == [(cmd, "1")]
+
+
 def test_get_changes_values():
     """Test that the `values` field returned from `GetChanges` is correctly populated"""
     conn = ControlConnection()
@@ -1105,6 +1224,29 @@ def test_get_changes_values_empty():
     ]
 
 
+def test_get_changes_values_with_markers():
+    """Test that values ending with the markers used for multiline fields and errors
+    are still returned in the `values` field from `GetChanges`"""
+    conn = ControlConnection()
+    cmd = GetChanges()
+
+    assert conn.send(cmd) == b"*CHANGES?\n"
+
+    assert conn.receive_bytes(b"!Field1=a<\n!Field2=b (error)\n.\n") == b""
+
+    assert get_responses(conn) == [
+        (
+            cmd,
+            Changes(
+                values={"Field1": "a<", "Field2": "b (error)"},
+                no_value=[],
+                in_error=[],
+                multiline_values={},
+            ),
+        )
+    ]
+
+
 def test_get_changes_no_value():
     """Test that the `no_value` field returned from `GetChanges` is correctly
     populated"""
@@ -1277,3 +1419,6 @@ def test_is_multiline_command():
     assert not is_multiline_command("SEQ.TABLE?")
     assert not is_multiline_command("*METADATA.DESIGN?")
     assert not is_multiline_command("*METADATA.DESIGN=B<B<B<B?")
+    assert not is_multiline_command("SEQ.TABLE?<")
+    assert not is_multiline_command("PCAP.TRIG=PULSE1.OUT")
+    assert not is_multiline_command("")